@@ -6,15 +6,22 @@ for Microsoft Remote Desktop Services
 """
 
 import argparse
+import functools
 import hashlib
 import hmac
 import secrets
 import sys
-from typing import Tuple
+from typing import List, Tuple
 
 # Character set for key encoding (base-24)
 KCHARS = "BCDFGHJKMPQRTVWXY2346789"
 
+# Base-24 digit for each character code (0xFF marks characters outside KCHARS)
+KCHARS_LUT = bytes(KCHARS.index(chr(c)) if chr(c) in KCHARS else 0xFF for c in range(256))
+
+# Left padding for encoded keys (35 characters)
+KEY_PADDING = KCHARS[0] * 35
+
 # License types with descriptions
 LICENSE_TYPES = {
     "001_5_0": "Windows 2000 Per Device",
@@ -71,19 +78,97 @@ class LKPCurve:
 
 
 def mod_inverse(a: int, m: int) -> int:
-    """Calculate modular multiplicative inverse using Extended Euclidean Algorithm"""
-    def extended_gcd(a: int, b: int) -> Tuple[int, int, int]:
-        if a == 0:
-            return b, 0, 1
-        gcd, x1, y1 = extended_gcd(b % a, a)
-        x = y1 - (b // a) * x1
-        y = x1
-        return gcd, x, y
+    """Calculate modular multiplicative inverse (native big-integer inversion)"""
+    try:
+        return pow(a % m, -1, m)
+    except ValueError:
+        raise ValueError("Modular inverse does not exist") from None
+
+
+# Point at infinity in Jacobian coordinates
+JACOBIAN_INFINITY = (1, 1, 0)
+
+
+def _jac_double(X: int, Y: int, Z: int, a: int, p: int) -> Tuple[int, int, int]:
+    """Double a point in Jacobian coordinates"""
+    if Z == 0 or Y == 0:
+        return JACOBIAN_INFINITY
+    
+    YY = Y * Y % p
+    S = 4 * X * YY % p
+    ZZ = Z * Z % p
+    M = (3 * X * X + a * ZZ * ZZ) % p
+    X3 = (M * M - 2 * S) % p
+    Y3 = (M * (S - X3) - 8 * YY * YY) % p
+    Z3 = 2 * Y * Z % p
+    return X3, Y3, Z3
+
+
+def _jac_add(X1: int, Y1: int, Z1: int, X2: int, Y2: int, Z2: int, a: int, p: int) -> Tuple[int, int, int]:
+    """Add two points in Jacobian coordinates"""
+    if Z1 == 0:
+        return X2, Y2, Z2
+    if Z2 == 0:
+        return X1, Y1, Z1
+    
+    Z1Z1 = Z1 * Z1 % p
+    Z2Z2 = Z2 * Z2 % p
+    U1 = X1 * Z2Z2 % p
+    U2 = X2 * Z1Z1 % p
+    S1 = Y1 * Z2 * Z2Z2 % p
+    S2 = Y2 * Z1 * Z1Z1 % p
+    # H and R are only squared or multiplied before the next reduction, so they stay unreduced
+    H = U2 - U1
+    R = S2 - S1
     
-    gcd, x, _ = extended_gcd(a % m, m)
-    if gcd != 1:
-        raise ValueError("Modular inverse does not exist")
-    return (x % m + m) % m
+    if H == 0:
+        if R == 0:
+            return _jac_double(X1, Y1, Z1, a, p)
+        return JACOBIAN_INFINITY
+    
+    HH = H * H % p
+    HHH = H * HH % p
+    V = U1 * HH % p
+    X3 = (R * R - HHH - 2 * V) % p
+    Y3 = (R * (V - X3) - S1 * HHH) % p
+    Z3 = Z1 * Z2 * H % p
+    return X3, Y3, Z3
+
+
+def _jac_add_affine(X1: int, Y1: int, Z1: int, x2: int, y2: int, a: int, p: int) -> Tuple[int, int, int]:
+    """Add a finite affine point to a point in Jacobian coordinates (mixed addition, Z2 = 1)"""
+    if Z1 == 0:
+        return x2, y2, 1
+    
+    Z1Z1 = Z1 * Z1 % p
+    U2 = x2 * Z1Z1 % p
+    S2 = y2 * Z1 * Z1Z1 % p
+    H = U2 - X1
+    R = S2 - Y1
+    
+    if H == 0:
+        if R == 0:
+            return _jac_double(X1, Y1, Z1, a, p)
+        return JACOBIAN_INFINITY
+    
+    HH = H * H % p
+    HHH = H * HH % p
+    V = X1 * HH % p
+    X3 = (R * R - HHH - 2 * V) % p
+    Y3 = (R * (V - X3) - Y1 * HHH) % p
+    Z3 = Z1 * H % p
+    return X3, Y3, Z3
+
+
+def _cswap(P0: Tuple[int, int, int], P1: Tuple[int, int, int], bit: int) -> Tuple[Tuple[int, int, int], Tuple[int, int, int]]:
+    """Swap two Jacobian points when bit is 1, using masks instead of a branch"""
+    mask = -bit
+    X0, Y0, Z0 = P0
+    X1, Y1, Z1 = P1
+    tx = (X0 ^ X1) & mask
+    ty = (Y0 ^ Y1) & mask
+    tz = (Z0 ^ Z1) & mask
+    return (X0 ^ tx, Y0 ^ ty, Z0 ^ tz), (X1 ^ tx, Y1 ^ ty, Z1 ^ tz)
 
 
 class EllipticCurvePoint:
@@ -102,6 +187,16 @@ class EllipticCurvePoint:
         point.infinity = True
         return point
     
+    @classmethod
+    def from_jacobian(cls, X: int, Y: int, Z: int, curve):
+        """Convert Jacobian coordinates (x = X/Z^2, y = Y/Z^3) to an affine point"""
+        if Z == 0:
+            return cls.infinity_point(curve)
+        p = curve.p
+        z_inv = mod_inverse(Z, p)
+        z_inv2 = z_inv * z_inv % p
+        return cls(X * z_inv2 % p, Y * z_inv2 * z_inv % p, curve)
+    
     def __add__(self, other):
         """Point addition on elliptic curve"""
         if self.infinity:
@@ -117,14 +212,15 @@ class EllipticCurvePoint:
         
         if self.x == other.x:
             if self.y == other.y:
-                # Point doubling
-                s = (3 * self.x * self.x + self.curve.a) * mod_inverse(2 * self.y, p) % p
+                # Point doubling; reduce the numerator before the final multiplication
+                three_xx_plus_a = (3 * self.x * self.x + self.curve.a) % p
+                s = three_xx_plus_a * mod_inverse((self.y << 1) % p, p) % p
             else:
                 # Points are inverse of each other
                 return EllipticCurvePoint.infinity_point(self.curve)
         else:
             # Point addition
-            s = (other.y - self.y) * mod_inverse(other.x - self.x, p) % p
+            s = (other.y - self.y) % p * mod_inverse((other.x - self.x) % p, p) % p
         
         x3 = (s * s - self.x - other.x) % p
         y3 = (s * (self.x - x3) - self.y) % p
@@ -132,22 +228,90 @@ class EllipticCurvePoint:
         return EllipticCurvePoint(x3, y3, self.curve)
     
     def __mul__(self, scalar: int):
-        """Scalar multiplication using double-and-add algorithm"""
+        """Scalar multiplication using a Montgomery ladder in Jacobian coordinates"""
         if scalar == 0:
             return EllipticCurvePoint.infinity_point(self.curve)
         if scalar < 0:
             raise ValueError("Scalar must be non-negative")
+        if self.infinity:
+            return EllipticCurvePoint.infinity_point(self.curve)
         
-        result = EllipticCurvePoint.infinity_point(self.curve)
-        addend = self
-        
-        while scalar:
-            if scalar & 1:
-                result = result + addend
-            addend = addend + addend
-            scalar >>= 1
-        
-        return result
+        p = self.curve.p
+        a = self.curve.a
+        R0 = JACOBIAN_INFINITY
+        R1 = (self.x, self.y, 1)
+        
+        # Same number of ladder steps for every scalar below the group order;
+        # the key bit only selects a swap, never which operations run
+        for i in reversed(range(max(scalar.bit_length(), self.curve.n.bit_length()))):
+            bit = (scalar >> i) & 1
+            R0, R1 = _cswap(R0, R1, bit)
+            R0, R1 = _jac_double(*R0, a, p), _jac_add(*R0, *R1, a, p)
+            R0, R1 = _cswap(R0, R1, bit)
+        
+        return EllipticCurvePoint.from_jacobian(*R0, self.curve)
+
+
+# Window width for fixed-base scalar multiplication
+FIXED_BASE_WINDOW = 4
+
+
+def _fixed_base_table(curve, base: str) -> List[List[Tuple[int, int]]]:
+    """Lazily build the table d * 2^(w*i) * B (d = 1..2^w) for the curve's G or K point, as affine (x, y) pairs"""
+    attr = f"_fixed_base_table_{base}"
+    table = curve.__dict__.get(attr)
+    if table is None:
+        point = EllipticCurvePoint(getattr(curve, base + "x"), getattr(curve, base + "y"), curve)
+        windows = -(-curve.n.bit_length() // FIXED_BASE_WINDOW)
+        table = []
+        for _ in range(windows):
+            multiple = point
+            row = [(multiple.x, multiple.y)]
+            for _ in range((1 << FIXED_BASE_WINDOW) - 1):
+                multiple = multiple + point
+                row.append((multiple.x, multiple.y))
+            table.append(row)
+            point = multiple
+        setattr(curve, attr, table)
+    return table
+
+
+def _masked_select(row: List[Tuple[int, int]], index: int) -> Tuple[int, int]:
+    """Return row[index] by scanning every entry with masks, so the lookup does not depend on index"""
+    x = y = 0
+    for j, (xj, yj) in enumerate(row):
+        # All ones when j == index, zero otherwise (j ^ index < 2^w)
+        mask = ((j ^ index) - 1) >> FIXED_BASE_WINDOW
+        x |= xj & mask
+        y |= yj & mask
+    return x, y
+
+
+def fixed_base_mul(scalar: int, curve, base: str = "G") -> EllipticCurvePoint:
+    """Multiply the curve's fixed G (or K) point by scalar using a precomputed table"""
+    if scalar < 0:
+        raise ValueError("Scalar must be non-negative")
+    
+    table = _fixed_base_table(curve, base)
+    
+    # Recode scalar + n (same point, since B has order n) with every window digit in 1..2^w,
+    # so each window does exactly one table addition regardless of the scalar's nibbles
+    offset = ((1 << (FIXED_BASE_WINDOW * len(table))) - 1) // ((1 << FIXED_BASE_WINDOW) - 1)
+    recoded = scalar + curve.n - offset
+    if recoded < 0 or recoded >> (FIXED_BASE_WINDOW * len(table)):
+        point = EllipticCurvePoint(getattr(curve, base + "x"), getattr(curve, base + "y"), curve)
+        return point * scalar
+    
+    a = curve.a
+    p = curve.p
+    mask = (1 << FIXED_BASE_WINDOW) - 1
+    result = JACOBIAN_INFINITY
+    for row in table:
+        # row[d] holds (d + 1) * 2^(w*i) * B
+        result = _jac_add_affine(*result, *_masked_select(row, recoded & mask), a, p)
+        recoded >>= FIXED_BASE_WINDOW
+    
+    return EllipticCurvePoint.from_jacobian(*result, curve)
 
 
 def bigint_to_bytes_le(n: int, length: int) -> bytes:
@@ -167,12 +331,13 @@ def encode_pkey(n: int) -> str:
     if n == 0:
         return ""
     
-    out = ""
+    chars = []
     while n > 0:
-        out = KCHARS[n % 24] + out
-        n //= 24
+        n, r = divmod(n, 24)
+        chars.append(KCHARS[r])
+    chars.reverse()
     
-    out = out.rjust(35, KCHARS[0])
+    out = KEY_PADDING[len(chars):] + "".join(chars)
     
     # Split into groups of 5
     segments = [out[i:i+5] for i in range(0, len(out), 5)]
@@ -186,11 +351,12 @@ def decode_pkey(key: str) -> int:
     if len(key_string) % 5 != 0:
         raise ValueError("Bad key length")
     
+    digits = key_string.encode('ascii', errors='replace').translate(KCHARS_LUT)
+    if 0xFF in digits:
+        raise ValueError(f"Invalid character: {key_string[digits.index(0xFF)]}")
+    
     out = 0
-    for char in key_string:
-        value = KCHARS.index(char)
-        if value == -1:
-            raise ValueError(f"Invalid character: {char}")
+    for value in digits:
         out = out * 24 + value
     
     return out
@@ -200,21 +366,21 @@ def rc4(key: bytes, data: bytes) -> bytes:
     """RC4 encryption/decryption"""
     s = list(range(256))
     j = 0
+    key_len = len(key)
     
     # Key scheduling
     for i in range(256):
-        j = (j + s[i] + key[i % len(key)]) % 256
+        j = (j + s[i] + key[i % key_len]) & 0xFF
         s[i], s[j] = s[j], s[i]
     
     # Pseudo-random generation
     i = j = 0
-    result = bytearray()
-    for byte in data:
-        i = (i + 1) % 256
-        j = (j + s[i]) % 256
+    result = bytearray(len(data))
+    for idx, byte in enumerate(data):
+        i = (i + 1) & 0xFF
+        j = (j + s[i]) & 0xFF
         s[i], s[j] = s[j], s[i]
-        k = s[(s[i] + s[j]) % 256]
-        result.append(byte ^ k)
+        result[idx] = byte ^ s[(s[i] + s[j]) & 0xFF]
     
     return bytes(result)
 
@@ -224,27 +390,33 @@ def get_spkid(pid: str) -> int:
     if len(pid) < 23:
         raise ValueError("Invalid PID length")
     
-    spkid_part1 = pid[10:16]
-    spkid_part2 = pid[18:23]
-    combined = spkid_part1 + spkid_part2
-    spkid_str = combined.split("-")[0]
+    # Digits run from offset 10 to the first '-' in pid[10:16] + pid[18:23]
+    spkid_str, sep, _ = pid[10:16].partition("-")
+    if not sep:
+        spkid_str += pid[18:23].partition("-")[0]
     
     return int(spkid_str)
 
 
+@functools.lru_cache(maxsize=128)
+def _rc4_key_for_pid(pid: str) -> bytes:
+    """RC4 key derived from the Product ID (first 5 bytes of MD5 over UTF-16-LE, zero padded)"""
+    return hashlib.md5(pid.encode('utf-16-le')).digest()[:5] + b'\x00' * 11
+
+
+@functools.lru_cache(maxsize=128)
+def _rc4_keystream_for_pid(pid: str) -> int:
+    """First 21 bytes of the PID's RC4 keystream, as a little-endian integer"""
+    return bytes_to_bigint_le(rc4(_rc4_key_for_pid(pid), b'\x00' * 21))
+
+
 def validate_tskey(pid: str, tskey: str, curve, is_spk: bool = True, debug: bool = False) -> bool:
     """Validate a Terminal Services key"""
     try:
         keydata_int = decode_pkey(tskey)
-        keydata_bytes = bigint_to_bytes_le(keydata_int, 21)
         
-        # Generate RC4 key from PID
-        pid_utf16le = pid.encode('utf-16-le')
-        md5_digest = hashlib.md5(pid_utf16le).digest()
-        rk = md5_digest[:5] + b'\x00' * 11
-        
-        # Decrypt
-        dc_kdata = rc4(rk, keydata_bytes)
+        # Decrypt with the PID's RC4 keystream
+        dc_kdata = bigint_to_bytes_le(keydata_int ^ _rc4_keystream_for_pid(pid), 21)
         
         if len(dc_kdata) < 21:
             if debug:
@@ -259,11 +431,8 @@ def validate_tskey(pid: str, tskey: str, curve, is_spk: bool = True, debug: bool
         s = (sigdata >> 35) & 0x1FFFFFFFFFFFFFFFFF
         
         # Verify signature
-        G = EllipticCurvePoint(curve.Gx, curve.Gy, curve)
-        K = EllipticCurvePoint(curve.Kx, curve.Ky, curve)
-        
-        hK = K * h
-        sG = G * s
+        hK = fixed_base_mul(h, curve, "K")
+        sG = fixed_base_mul(s, curve)
         R = hK + sG
         
         if R.infinity:
@@ -274,8 +443,10 @@ def validate_tskey(pid: str, tskey: str, curve, is_spk: bool = True, debug: bool
         Rx_bytes = bigint_to_bytes_le(R.x, 48)
         Ry_bytes = bigint_to_bytes_le(R.y, 48)
         
-        sha1_input = keydata_inner + Rx_bytes + Ry_bytes
-        md = hashlib.sha1(sha1_input).digest()
+        sha1 = hashlib.sha1(keydata_inner)
+        sha1.update(Rx_bytes)
+        sha1.update(Ry_bytes)
+        md = sha1.digest()
         
         part1 = bytes_to_bigint_le(md[:4])
         part2_intermediate = bytes_to_bigint_le(md[4:8])
@@ -304,27 +475,30 @@ def validate_tskey(pid: str, tskey: str, curve, is_spk: bool = True, debug: bool
         return False
 
 
-def generate_tskey(pid: str, keydata_inner: bytes, curve, max_attempts: int = 1000) -> str:
+def generate_tskey(pid: str, keydata_inner: bytes, curve, max_attempts: int = 1000, debug: bool = False) -> str:
     """Generate a Terminal Services key"""
-    # Generate RC4 key from PID
-    pid_utf16le = pid.encode('utf-16-le')
-    md5_digest = hashlib.md5(pid_utf16le).digest()
-    rk = md5_digest[:5] + b'\x00' * 11
+    # The RC4 keystream depends only on the PID, so XOR it into each candidate
+    keystream = _rc4_keystream_for_pid(pid)
     
-    G = EllipticCurvePoint(curve.Gx, curve.Gy, curve)
+    # Hash state for the fixed key data prefix, copied for each attempt
+    sha1_prefix = hashlib.sha1(keydata_inner)
     
+    # Attempts run serially: a key typically needs a few dozen sub-millisecond
+    # attempts, well below the cost of starting a process pool
     for attempt in range(max_attempts):
         # Generate random nonce
         c_nonce = secrets.randbelow(curve.n - 1) + 1
         
         # Calculate R = c_nonce * G
-        R = G * c_nonce
+        R = fixed_base_mul(c_nonce, curve)
         
         # Calculate hash
         Rx_bytes = bigint_to_bytes_le(R.x, 48)
         Ry_bytes = bigint_to_bytes_le(R.y, 48)
-        sha1_input = keydata_inner + Rx_bytes + Ry_bytes
-        md = hashlib.sha1(sha1_input).digest()
+        sha1 = sha1_prefix.copy()
+        sha1.update(Rx_bytes)
+        sha1.update(Ry_bytes)
+        md = sha1.digest()
         
         part1 = bytes_to_bigint_le(md[:4])
         part2_intermediate = bytes_to_bigint_le(md[4:8])
@@ -338,8 +512,10 @@ def generate_tskey(pid: str, keydata_inner: bytes, curve, max_attempts: int = 10
         s_masked = s & 0x1FFFFFFFFFFFFFFFFF
         h_masked = h & 0x7FFFFFFFFF
         
-        # Check if s fits in the mask - both conditions must pass
-        if s_masked != s or s_masked >= 0x1FFFFFFFFFFFFFFFFF:
+        # Check if s fits in the mask - both conditions must pass. The decoder also reads h
+        # through a 39-bit mask that overlaps the low 4 bits of s, so those must be zero for
+        # h to round-trip; R = hK + sG then holds by construction and the key validates
+        if s_masked != s or s_masked >= 0x1FFFFFFFFFFFFFFFFF or s & 0xF:
             continue
         
         # Encode signature
@@ -351,19 +527,22 @@ def generate_tskey(pid: str, keydata_inner: bytes, curve, max_attempts: int = 10
             continue
         
         # Encrypt
-        pke = rc4(rk, pkdata)
+        pke = bigint_to_bytes_le(bytes_to_bigint_le(pkdata) ^ keystream, 21)
         pk = bytes_to_bigint_le(pke[:20])
         pkstr = encode_pkey(pk)
         
-        # Validate
-        is_spk = (curve.n == SPKCurve.n)
-        if validate_tskey(pid, pkstr, curve, is_spk):
-            return pkstr
+        # Full decode/verify round trip, only in debug mode
+        if debug:
+            is_spk = (curve.n == SPKCurve.n)
+            if not validate_tskey(pid, pkstr, curve, is_spk, debug=True):
+                continue
+        
+        return pkstr
     
     raise RuntimeError(f"Failed to generate valid key after {max_attempts} attempts")
 
 
-def generate_spk(pid: str) -> str:
+def generate_spk(pid: str, debug: bool = False) -> str:
     """Generate SPK (License Server ID)"""
     spkid_num = get_spkid(pid)
     spkdata = bigint_to_bytes_le(spkid_num, 7)
@@ -371,10 +550,10 @@ def generate_spk(pid: str) -> str:
     if len(spkdata) != 7:
         raise ValueError("SPKID did not convert to 7 bytes")
     
-    return generate_tskey(pid, spkdata, SPKCurve)
+    return generate_tskey(pid, spkdata, SPKCurve, debug=debug)
 
 
-def generate_lkp(pid: str, count: int, chid: int, major_ver: int, minor_ver: int) -> str:
+def generate_lkp(pid: str, count: int, chid: int, major_ver: int, minor_ver: int, debug: bool = False) -> str:
     """Generate LKP (License Key Pack)"""
     # Calculate version encoding
     version = 1
@@ -388,7 +567,7 @@ def generate_lkp(pid: str, count: int, chid: int, major_ver: int, minor_ver: int
     if len(lkpdata) != 7:
         raise ValueError("LKP Info did not convert to 7 bytes")
     
-    return generate_tskey(pid, lkpdata, LKPCurve)
+    return generate_tskey(pid, lkpdata, LKPCurve, debug=debug)
 
 
 def list_licenses():
@@ -0,0 +1,74 @@
+"""Tests for the LyssaRDSGen command line tool"""
+
+import pytest
+
+from lyssa_rds_gen import (
+    EllipticCurvePoint,
+    LKPCurve,
+    SPKCurve,
+    fixed_base_mul,
+    generate_lkp,
+    generate_spk,
+    rc4,
+    validate_tskey,
+)
+
+PID = "00490-92005-99454-AT527"
+KNOWN_SPK = "R2W9K-XKV49-3364Q-92YYM-TKFWJ-DKRCJ-KC2XH"
+
+
+def affine_mul(point, scalar):
+    """Reference affine double-and-add"""
+    result = EllipticCurvePoint.infinity_point(point.curve)
+    while scalar:
+        if scalar & 1:
+            result = result + point
+        point = point + point
+        scalar >>= 1
+    return result
+
+
+@pytest.mark.parametrize("curve", [SPKCurve, LKPCurve])
+@pytest.mark.parametrize("base", ["G", "K"])
+def test_fixed_base_mul_matches_affine(curve, base):
+    point = EllipticCurvePoint(getattr(curve, base + "x"), getattr(curve, base + "y"), curve)
+    for scalar in [0, 1, 15, 16, curve.n - 1, curve.n, (1 << 72) + 12345, 1 << 80]:
+        expected = affine_mul(point, scalar)
+        result = fixed_base_mul(scalar, curve, base)
+        assert result.infinity == expected.infinity, scalar
+        if not expected.infinity:
+            assert (result.x, result.y) == (expected.x, expected.y), scalar
+
+
+def test_fixed_base_mul_rejects_negative_scalar():
+    with pytest.raises(ValueError):
+        fixed_base_mul(-1, SPKCurve)
+
+
+def test_rc4_known_answer():
+    assert rc4(b"Key", b"Plaintext") == bytes.fromhex("BBF316E8D940AF0AD3")
+    assert rc4(b"Wiki", b"pedia") == bytes.fromhex("1021BF0420")
+
+
+def test_validate_known_spk():
+    assert validate_tskey(PID, KNOWN_SPK, SPKCurve, is_spk=True)
+    assert not validate_tskey("00490-92005-99454-AT528", KNOWN_SPK, SPKCurve, is_spk=True)
+
+
+@pytest.mark.parametrize("pid", [PID, "55041-01234-56789-AA001"])
+def test_generated_spk_validates(pid):
+    for _ in range(5):
+        spk = generate_spk(pid)
+        assert validate_tskey(pid, spk, SPKCurve, is_spk=True)
+
+
+@pytest.mark.parametrize("pid", [PID, "55041-01234-56789-AA001"])
+def test_generated_lkp_validates(pid):
+    for _ in range(5):
+        lkp = generate_lkp(pid, 1234, 29, 10, 2)
+        assert validate_tskey(pid, lkp, LKPCurve, is_spk=False)
+
+
+def test_generate_debug_round_trip():
+    assert validate_tskey(PID, generate_spk(PID, debug=True), SPKCurve, is_spk=True)
+    assert validate_tskey(PID, generate_lkp(PID, 77, 32, 10, 3, debug=True), LKPCurve, is_spk=False)